@@ -1,17 +1,48 @@
 import os
 import sys
 import types
+
+##########################################
+# CELL LIBRARY MODULE SOURCE
+##########################################
+
+# The complete source of cell_library.py. This string is the only definition
+# of the magics, import hook and export button: the installer writes it to
+# disk and then loads it, so there is no second copy to keep in sync.
+cell_library_source = r'''import os
+import string
+import sys
+import types
+import importlib.util
+from importlib.machinery import ModuleSpec
 from IPython import get_ipython
 from IPython.core.magic import Magics, cell_magic, line_magic, magics_class
-from IPython.display import display, Javascript
 
 ###############################
 # CELL LIBRARY CORE DEFINITION
 ###############################
 
-# Global registry to store library cell code by name.
+# Global registry mapping library name -> SimpleNamespace(src_bytes, code):
+# the cell's UTF-8 encoded source and its compiled code object.
 _LIBRARY_REGISTRY = {}
 
+# Module specs for every importable name ("cell.<lib_name>" and "<lib_name>"),
+# kept in step with _LIBRARY_REGISTRY so CellLibraryFinder is one dict probe.
+_SPEC_CACHE = {}
+
+# The "cell" pseudo-package that lists available libraries. It is built once
+# and reused; the empty __path__ makes it a package, so "cell.<lib_name>" can
+# be imported beneath it. __all__ lists the libraries that were pre-loaded.
+_CELL_PKG = types.ModuleType("cell")
+_CELL_PKG.__package__ = "cell"
+_CELL_PKG.__path__ = []
+_CELL_PKG.__all__ = []
+
+# Set CELL_LIBRARY_QUIET to 1, true or yes (any case) to suppress success
+# messages; any other value, including 0 and false, leaves them on. Errors
+# are always shown.
+_QUIET = os.environ.get("CELL_LIBRARY_QUIET", "").strip().lower() in ("1", "true", "yes")
+
 @magics_class
 class CellLibraryMagics(Magics):
 
@@ -26,10 +57,34 @@ class CellLibraryMagics(Magics):
         """
         lib_name = line.strip()
         if not lib_name:
-            print("Please provide a library name. Usage: %%library <library_name>")
+            sys.stderr.write("Please provide a library name. Usage: %%library <library_name>\n")
+            return
+        try:
+            code = compile(cell, f"<cell_library:{lib_name}>", "exec")
+        except SyntaxError as e:
+            sys.stderr.write(f"Error compiling library '{lib_name}': {e}\n")
             return
-        _LIBRARY_REGISTRY[lib_name] = cell
-        print(f"Library cell '{lib_name}' stored successfully.")
+        entry = types.SimpleNamespace(src_bytes=cell.encode("utf-8"), code=code)
+        _LIBRARY_REGISTRY[lib_name] = entry
+        loader = CellLibraryLoader(lib_name, code)
+        spec = ModuleSpec(f"cell.{lib_name}", loader, is_package=False)
+        _SPEC_CACHE[spec.name] = spec
+        # A library named "cell" must not claim the bare name, or it would
+        # hide the "cell" pseudo-package; it stays importable as cell.cell.
+        if lib_name != "cell":
+            _SPEC_CACHE[lib_name] = ModuleSpec(lib_name, loader, is_package=False)
+        try:
+            _inject_module(lib_name, spec)
+        except ImportError as e:
+            # Pre-loading is best-effort: a cell that relies on the caller's
+            # globals can still be run with %import_library.
+            sys.stderr.write(
+                f"Library cell '{lib_name}' stored; could not pre-load it as "
+                f"module {spec.name}: {e.__context__ or e}\n"
+            )
+            return
+        if not _QUIET:
+            sys.stdout.write(f"Library cell '{lib_name}' stored successfully.\n")
 
     @line_magic
     def import_library(self, line):
@@ -40,16 +95,17 @@ class CellLibraryMagics(Magics):
         The code of the library cell is executed in the caller's global scope.
         """
         lib_name = line.strip()
-        if lib_name not in _LIBRARY_REGISTRY:
-            print(f"Library '{lib_name}' not found. Please define it with %%library first.")
+        entry = _LIBRARY_REGISTRY.get(lib_name)
+        if entry is None:
+            sys.stderr.write(f"Library '{lib_name}' not found. Please define it with %%library first.\n")
             return
-        code = _LIBRARY_REGISTRY[lib_name]
-        caller_globals = self.shell.user_ns
+        ns = self.shell.user_ns
         try:
-            exec(code, caller_globals)
-            print(f"Library '{lib_name}' imported successfully.")
+            exec(entry.code, ns)
+            if not _QUIET:
+                sys.stdout.write(f"Library '{lib_name}' imported successfully.\n")
         except Exception as e:
-            print(f"Error importing library '{lib_name}': {e}")
+            sys.stderr.write(f"Error importing library '{lib_name}': {e}\n")
 
     @line_magic
     def export_library(self, line):
@@ -59,21 +115,23 @@ class CellLibraryMagics(Magics):
             %export_library <library_name> <file_path>
         The cell's code is written to the given file.
         """
-        parts = line.strip().split()
+        # Split once at the first run of whitespace; the rest is the path.
+        parts = line.split(None, 1)
         if len(parts) != 2:
-            print("Usage: %export_library <library_name> <file_path>")
+            sys.stderr.write("Usage: %export_library <library_name> <file_path>\n")
             return
-        lib_name, file_path = parts
-        if lib_name not in _LIBRARY_REGISTRY:
-            print(f"Library '{lib_name}' not found. Please define it with %%library first.")
+        lib_name, file_path = parts[0], parts[1].strip()
+        entry = _LIBRARY_REGISTRY.get(lib_name)
+        if entry is None:
+            sys.stderr.write(f"Library '{lib_name}' not found. Please define it with %%library first.\n")
             return
-        code = _LIBRARY_REGISTRY[lib_name]
         try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(code)
-            print(f"Library '{lib_name}' exported to '{file_path}'.")
+            with open(file_path, "wb") as f:
+                f.write(entry.src_bytes)
+            if not _QUIET:
+                sys.stdout.write(f"Library '{lib_name}' exported to '{file_path}'.\n")
         except Exception as e:
-            print(f"Error exporting library '{lib_name}': {e}")
+            sys.stderr.write(f"Error exporting library '{lib_name}': {e}\n")
 
 # Register the magics so they are available in the notebook.
 ip = get_ipython()
@@ -87,10 +145,11 @@ if ip:
 class CellLibraryLoader:
     """
     A loader that creates a module from a library cell.
+    `code_obj` is the cell's code object, compiled once by %%library.
     """
-    def __init__(self, lib_name, code):
+    def __init__(self, lib_name, code_obj):
         self.lib_name = lib_name
-        self.code = code
+        self.code_obj = code_obj
 
     def create_module(self, spec):
         # Use default module creation semantics.
@@ -98,58 +157,112 @@ class CellLibraryLoader:
 
     def exec_module(self, module):
         try:
-            exec(self.code, module.__dict__)
+            exec(self.code_obj, module.__dict__)
         except Exception as e:
             raise ImportError(f"Error loading cell library '{self.lib_name}': {e}")
 
+def _inject_module(lib_name, spec):
+    """
+    Build the module for a library cell and place it in sys.modules, so that
+    later imports are answered by the sys.modules check and never reach the
+    meta path. CellLibraryFinder stays installed as the fallback for entries
+    removed from sys.modules or cells that failed to run here.
+    This runs the cell's side effects once when the library is defined; a
+    later %import_library runs them again in the caller's namespace.
+    """
+    # Drop modules from an earlier definition of this library up front, so a
+    # cell that now fails to run is not shadowed by its previous version.
+    for name in (spec.name, lib_name):
+        if _is_cell_module(sys.modules.get(name)):
+            del sys.modules[name]
+    # Likewise on the pseudo-package, so a failed redefinition does not leave
+    # a name in __all__ whose import would break "from cell import *".
+    if lib_name in _CELL_PKG.__all__:
+        _CELL_PKG.__all__.remove(lib_name)
+        delattr(_CELL_PKG, lib_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[spec.name] = module
+    # The bare name is only claimed if no real module already owns it, and
+    # never for "cell", which belongs to the pseudo-package.
+    if lib_name != "cell" and lib_name not in sys.modules:
+        sys.modules[lib_name] = module
+    setattr(_CELL_PKG, lib_name, module)
+    _CELL_PKG.__all__.append(lib_name)
+
+def _is_cell_module(module):
+    # Loaders from an earlier install are a different class, so compare by name.
+    loader = getattr(module, "__loader__", None)
+    return type(loader).__name__ == "CellLibraryLoader"
+
 class CellLibraryFinder:
     """
-    A meta path finder that looks for modules in _LIBRARY_REGISTRY.
+    A meta path finder that serves the specs %%library stores in _SPEC_CACHE.
     It supports:
       - import cell.<lib_name>
       - from cell.<lib_name> import *
     It also optionally supports aliasing (see note below).
     """
     def find_spec(self, fullname, path, target=None):
-        # We handle module names that start with "cell." or exactly "cell"
-        parts = fullname.split('.')
-        if parts[0] == "cell":
-            # If fullname is exactly "cell", we create a pseudo-package that lists available libraries.
-            if len(parts) == 1:
-                spec = types.ModuleType(fullname)
-                spec.__package__ = fullname
-                spec.__spec__ = None
-                # We add an __all__ attribute for convenience.
-                spec.__all__ = list(_LIBRARY_REGISTRY.keys())
-                sys.modules[fullname] = spec
-                return None  # Returning None defers to normal import behavior.
-            elif len(parts) == 2:
-                lib_name = parts[1]
-                if lib_name in _LIBRARY_REGISTRY:
-                    from importlib.machinery import ModuleSpec
-                    code = _LIBRARY_REGISTRY[lib_name]
-                    loader = CellLibraryLoader(lib_name, code)
-                    spec = ModuleSpec(fullname, loader, is_package=False)
-                    return spec
-        else:
-            # Optionally, if the fullname itself matches a key in _LIBRARY_REGISTRY,
-            # then allow direct import (e.g., "import testing" if "testing" is a cell).
-            if fullname in _LIBRARY_REGISTRY:
-                from importlib.machinery import ModuleSpec
-                code = _LIBRARY_REGISTRY[fullname]
-                loader = CellLibraryLoader(fullname, code)
-                spec = ModuleSpec(fullname, loader, is_package=False)
-                return spec
+        # Every import in the kernel passes through here, so both
+        # "cell.<lib_name>" and direct imports (e.g., "import testing" if
+        # "testing" is a cell) are answered by a single dict lookup.
+        spec = _SPEC_CACHE.get(fullname)
+        if spec is not None:
+            return spec
+        # "cell" itself is only looked up while it is missing from
+        # sys.modules; this finder then loads it as the cached _CELL_PKG.
+        if fullname == "cell":
+            return ModuleSpec(fullname, self, is_package=True)
         return None
 
-# Insert the finder at the front of sys.meta_path so it takes priority.
-if not any(isinstance(f, CellLibraryFinder) for f in sys.meta_path):
-    sys.meta_path.insert(0, CellLibraryFinder())
+    def create_module(self, spec):
+        # Only used for the "cell" pseudo-package; library cells have their own loader.
+        return _CELL_PKG
+
+    def exec_module(self, module):
+        pass
+
+# A "cell" package left by an earlier install would hide this install's
+# _CELL_PKG, so drop it and let the next "import cell" load the new one.
+if type(getattr(sys.modules.get("cell"), "__loader__", None)).__name__ == "CellLibraryFinder":
+    del sys.modules["cell"]
+# Library modules pre-loaded by an earlier install belong to a registry that
+# no longer exists; drop them so imports go through this install's finder.
+for name in [name for name, module in sys.modules.items() if _is_cell_module(module)]:
+    del sys.modules[name]
+
+# Put the finder at the front of sys.meta_path so it takes priority. The list
+# is rebuilt in one assignment; finders are matched by class name so one left
+# by an earlier install (a different class object) is replaced, not stacked.
+# When this module is re-executed in the same namespace (importlib.reload,
+# %run -i) the sentinel survives and the existing finder, which reads these
+# module globals, is left in place without touching sys.meta_path again.
+if not globals().get("_FINDER_INSTALLED"):
+    sys.meta_path[:] = [CellLibraryFinder()] + [
+        f for f in sys.meta_path if type(f).__name__ != "CellLibraryFinder"
+    ]
+    _FINDER_INSTALLED = True
 
 ##########################################
 # OPTIONAL: UI BUTTON FOR EXPORT
 ##########################################
 
+# The button script is built once at import; each call only substitutes names.
+_JS_TEMPLATE = string.Template("""
+    (function() {
+        var btn = document.createElement('button');
+        btn.id = '${button_id}';
+        btn.innerHTML = 'Export Library: ${lib_name}';
+        btn.style.margin = '5px';
+        btn.onclick = function() {
+            alert("Export logic for library: ${lib_name} would run here.");
+        };
+        var toolbar = document.querySelector('#maintoolbar-container') || document.body;
+        toolbar.appendChild(btn);
+    })();
+    """)
+
 def inject_export_button(lib_name):
     """
     Injects a button into the Jupyter notebook that, when clicked,
@@ -157,158 +270,59 @@ def inject_export_button(lib_name):
     
     Note: For demonstration purposes only.
     """
-    button_id = f"export-btn-{lib_name}"
-    js_code = f"""
-    (function() {{
-        var btn = document.createElement('button');
-        btn.id = '{button_id}';
-        btn.innerHTML = 'Export Library: {lib_name}';
-        btn.style.margin = '5px';
-        btn.onclick = function() {{
-            alert("Export logic for library: {lib_name} would run here.");
-        }};
-        var toolbar = document.querySelector('#maintoolbar-container') || document.body;
-        toolbar.appendChild(btn);
-    }})();
-    """
+    # Imported here so loading cell_library does not pull in IPython.display.
+    from IPython.display import display, Javascript
+    js_code = _JS_TEMPLATE.substitute(button_id=f"export-btn-{lib_name}", lib_name=lib_name)
     display(Javascript(js_code))
+'''
+
+# Encoded once, so the installer can hand the bytes straight to os.write.
+_SRC_BYTES = cell_library_source.encode("utf-8")
 
 ##########################################
 # WRITE OUT THE MODULE (INSTALLER)
 ##########################################
 
-# Combine all the above source code into a string.
-cell_library_source = r'''import os
-import sys
-import types
-from IPython import get_ipython
-from IPython.core.magic import Magics, cell_magic, line_magic, magics_class
-from IPython.display import display, Javascript
-
-# Global registry to store library cell code by name.
-_LIBRARY_REGISTRY = {}
-
-@magics_class
-class CellLibraryMagics(Magics):
-
-    @cell_magic
-    def library(self, line, cell):
-        lib_name = line.strip()
-        if not lib_name:
-            print("Please provide a library name. Usage: %%library <library_name>")
-            return
-        _LIBRARY_REGISTRY[lib_name] = cell
-        print(f"Library cell '{lib_name}' stored successfully.")
-
-    @line_magic
-    def import_library(self, line):
-        lib_name = line.strip()
-        if lib_name not in _LIBRARY_REGISTRY:
-            print(f"Library '{lib_name}' not found. Please define it with %%library first.")
-            return
-        code = _LIBRARY_REGISTRY[lib_name]
-        caller_globals = self.shell.user_ns
-        try:
-            exec(code, caller_globals)
-            print(f"Library '{lib_name}' imported successfully.")
-        except Exception as e:
-            print(f"Error importing library '{lib_name}': {e}")
-
-    @line_magic
-    def export_library(self, line):
-        parts = line.strip().split()
-        if len(parts) != 2:
-            print("Usage: %export_library <library_name> <file_path>")
-            return
-        lib_name, file_path = parts
-        if lib_name not in _LIBRARY_REGISTRY:
-            print(f"Library '{lib_name}' not found. Please define it with %%library first.")
-            return
-        code = _LIBRARY_REGISTRY[lib_name]
-        try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(code)
-            print(f"Library '{lib_name}' exported to '{file_path}'.")
-        except Exception as e:
-            print(f"Error exporting library '{lib_name}': {e}")
-
-ip = get_ipython()
-if ip:
-    ip.register_magics(CellLibraryMagics)
-
-class CellLibraryLoader:
-    def __init__(self, lib_name, code):
-        self.lib_name = lib_name
-        self.code = code
-
-    def create_module(self, spec):
-        return None
-
-    def exec_module(self, module):
-        try:
-            exec(self.code, module.__dict__)
-        except Exception as e:
-            raise ImportError(f"Error loading cell library '{self.lib_name}': {e}")
-
-class CellLibraryFinder:
-    def find_spec(self, fullname, path, target=None):
-        parts = fullname.split('.')
-        if parts[0] == "cell":
-            if len(parts) == 1:
-                spec = types.ModuleType(fullname)
-                spec.__package__ = fullname
-                spec.__spec__ = None
-                spec.__all__ = list(_LIBRARY_REGISTRY.keys())
-                sys.modules[fullname] = spec
-                return None
-            elif len(parts) == 2:
-                lib_name = parts[1]
-                if lib_name in _LIBRARY_REGISTRY:
-                    from importlib.machinery import ModuleSpec
-                    code = _LIBRARY_REGISTRY[lib_name]
-                    loader = CellLibraryLoader(lib_name, code)
-                    spec = ModuleSpec(fullname, loader, is_package=False)
-                    return spec
-        else:
-            if fullname in _LIBRARY_REGISTRY:
-                from importlib.machinery import ModuleSpec
-                code = _LIBRARY_REGISTRY[fullname]
-                loader = CellLibraryLoader(fullname, code)
-                spec = ModuleSpec(fullname, loader, is_package=False)
-                return spec
-        return None
-
-if not any(isinstance(f, CellLibraryFinder) for f in sys.meta_path):
-    sys.meta_path.insert(0, CellLibraryFinder())
-
-def inject_export_button(lib_name):
-    button_id = f"export-btn-{lib_name}"
-    js_code = f\"
-    (function() {{
-        var btn = document.createElement('button');
-        btn.id = '{button_id}';
-        btn.innerHTML = 'Export Library: {lib_name}';
-        btn.style.margin = '5px';
-        btn.onclick = function() {{
-            alert("Export logic for library: {lib_name} would run here.");
-        }};
-        var toolbar = document.querySelector('#maintoolbar-container') || document.body;
-        toolbar.appendChild(btn);
-    }})();
-    \"
-    display(Javascript(js_code))
-'''
-
-# Define the installation path.
-install_path = os.path.join(os.getcwd(), "cell_library.py")
-
-with open(install_path, "w", encoding="utf-8") as f:
-    f.write(cell_library_source)
+# Define the installation path: next to this installer, so it does not depend
+# on the notebook's current directory. When the installer is pasted into a
+# cell there is no __file__, and the working directory is used instead.
+try:
+    install_dir = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    install_dir = os.getcwd()
+install_path = os.path.join(install_dir, "cell_library.py")
+
+# Write the pre-encoded source with os.write, bypassing the text and buffering
+# layers of open(); for a file this size that is normally one write(2), and the
+# loop picks up after any short write. It goes to a temporary file that is synced and
+# then renamed over the target, so a kernel importing cell_library.py during a
+# re-install sees either the old file or the new one, never a partial write.
+tmp_path = install_path + ".tmp"
+fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+try:
+    try:
+        remaining = memoryview(_SRC_BYTES)
+        while remaining:
+            remaining = remaining[os.write(fd, remaining):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, install_path)
+except BaseException:
+    # Don't leave a partial cell_library.py.tmp behind.
+    os.unlink(tmp_path)
+    raise
 
 print(f"Installation complete: 'cell_library.py' has been written to {install_path}")
 
-# Load the newly created module into the current notebook.
-get_ipython().run_line_magic("run", "cell_library.py")
+# Load the module straight from the in-memory source rather than having %run
+# read back and re-parse the file we just wrote. Registering it in sys.modules
+# makes a later "import cell_library" reuse this instance.
+cell_library = types.ModuleType("cell_library")
+cell_library.__file__ = install_path
+exec(compile(cell_library_source, install_path, "exec"), cell_library.__dict__)
+sys.modules["cell_library"] = cell_library
+inject_export_button = cell_library.inject_export_button
 
 print("cell_library module loaded.")
 print("You may now use the following in your notebook:")